@@ -1,3 +1,4 @@
+from .cache import ResponseCache
 from .client import DadisClient
 
-__all__ = ["DadisClient"]
\ No newline at end of file
+__all__ = ["DadisClient", "ResponseCache"]
\ No newline at end of file
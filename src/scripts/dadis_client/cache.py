@@ -0,0 +1,51 @@
+import hashlib
+import json
+import pickle
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+DEFAULT_CACHE_DIR = ".dadis_cache"
+# One week, in seconds
+DEFAULT_CACHE_TTL = 7 * 24 * 60 * 60
+
+
+class ResponseCache:
+    """
+    On-disk cache for decoded DADIS API responses.
+
+    Each entry is pickled to its own file, named by a hash of the request,
+    and is treated as missing once it is older than ttl seconds
+    """
+
+    cache_dir: Path
+    ttl: float
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, ttl: float = DEFAULT_CACHE_TTL):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(url: str, api_key: str, params: Optional[dict] = None) -> str:
+        key_data = url + api_key + json.dumps(params, sort_keys=True)
+        return hashlib.sha1(key_data.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self.cache_dir / f"{key}.pickle"
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                return None
+            with path.open("rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def set(self, key: str, value: Any):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.cache_dir / f"{key}.pickle"
+        # Write to a temporary file first so a partially written entry
+        #   is never read back
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("wb") as f:
+            pickle.dump(value, f)
+        tmp_path.replace(path)
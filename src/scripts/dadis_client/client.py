@@ -1,5 +1,9 @@
+from typing import Any, Optional
+
 from requests import Session, Response
+from requests.adapters import HTTPAdapter
 
+from .cache import ResponseCache
 from .schemas.responses import ApiResponse, Species, BreedResponse, TransboundaryNamesResponse
 
 DEV_URL = "https://us-central1-fao-dadis-dev.cloudfunctions.net/api/v1/"
@@ -8,39 +12,62 @@ PROD_URL = "https://us-central1-dadis-ws.cloudfunctions.net/api/v1/"
 
 class DadisClient:
     _session: Session
+    _cache: Optional[ResponseCache]
     base_url: str
 
-    def __init__(self, *, api_key: str, prod: bool = True):
+    def __init__(
+        self, *, api_key: str, prod: bool = True, cache: Optional[ResponseCache] = None
+    ):
         if prod:
             self.base_url = PROD_URL
         else:
             self.base_url = DEV_URL
+        # All requests share one session, so connections to the API are kept
+        #   alive and reused, including when endpoints are fetched concurrently
         self._session = Session()
+        self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
         self._session.headers["Authorization"] = api_key
+        self._cache = cache
 
     def get(self, path, **kwargs) -> Response:
         return self._session.get(self.base_url + path, **kwargs)
 
+    def get_json(self, path, params: Optional[dict] = None) -> Any:
+        """
+        Get the decoded JSON for path, using the response cache if one is set
+        """
+        if self._cache is None:
+            return self.get(path, params=params).json()
+        key = ResponseCache.make_key(
+            self.base_url + path, self._session.headers["Authorization"], params
+        )
+        data = self._cache.get(key)
+        if data is None:
+            resp = self.get(path, params=params)
+            data = resp.json()
+            # Only cache successful responses
+            if resp.ok:
+                self._cache.set(key, data)
+        return data
+
     def get_all_species(self) -> ApiResponse[list[Species]]:
-        resp = self.get("species")
-        return ApiResponse[list[Species]](**resp.json())
+        return ApiResponse[list[Species]](**self.get_json("species"))
 
     def get_species_by_id(self, species_id: int) -> ApiResponse[Species]:
-        resp = self.get(f"species/{species_id}")
-        return ApiResponse[Species](**resp.json())
+        return ApiResponse[Species](**self.get_json(f"species/{species_id}"))
 
     def get_all_breeds(self) -> BreedResponse:
-        resp = self.get("breeds", params={"classification": "all"})
-        return BreedResponse(**resp.json())
+        return BreedResponse(**self.get_json("breeds", params={"classification": "all"}))
 
     def get_all_local_breeds(self) -> BreedResponse:
-        resp = self.get("breeds", params={"classification": "local"})
-        return BreedResponse(**resp.json())
+        return BreedResponse(
+            **self.get_json("breeds", params={"classification": "local"})
+        )
 
     def get_all_transboundary_breeds(self) -> BreedResponse:
-        resp = self.get("breeds", params={"classification": "transboundary"})
-        return BreedResponse(**resp.json())
+        return BreedResponse(
+            **self.get_json("breeds", params={"classification": "transboundary"})
+        )
 
     def get_all_transboundary_names(self) -> TransboundaryNamesResponse:
-        resp = self.get("transboundary")
-        return TransboundaryNamesResponse(**resp.json())
+        return TransboundaryNamesResponse(**self.get_json("transboundary"))
@@ -1,5 +1,4 @@
 import argparse
-import csv
 import logging
 import os
 import shutil
@@ -88,20 +87,19 @@ def get_dadis_species(client: DadisClient) -> pd.DataFrame:
 
 def get_dadis_all_breeds(client: DadisClient) -> pd.DataFrame:
     resp = client.get_all_breeds()
-    df = (
-        pd.DataFrame.from_records([breed.model_dump() for breed in resp.response])
-        .convert_dtypes()
-        .rename(
-            columns={
-                "id": "dadis_breed_id",
-                "name": "dadis_breed_name",
-                "iso3": "dadis_iso3_code",
-                "speciesId": "dadis_species_id",
-                "transboundaryId": "dadis_transboundary_id",
-                "updatedAt": "dadis_update_date",
-            }
-        )
-    )
+    # Read each column directly from the response models, rather than
+    #   serializing every breed with model_dump()
+    breeds = resp.response
+    df = pd.DataFrame(
+        {
+            "dadis_breed_id": [breed.id for breed in breeds],
+            "dadis_breed_name": [breed.name for breed in breeds],
+            "dadis_iso3_code": [breed.iso3 for breed in breeds],
+            "dadis_species_id": [breed.speciesId for breed in breeds],
+            "dadis_transboundary_id": [breed.transboundaryId for breed in breeds],
+            "dadis_update_date": [breed.updatedAt for breed in breeds],
+        }
+    ).convert_dtypes()
     df["dadis_update_date"] = df["dadis_update_date"].map(
         lambda d: pd.to_datetime(d, unit="ms")
     )
@@ -153,17 +151,16 @@ def write_tsv_header(
     """
     Copy the two header lines from the input file to output_file, adding the columns in extra_cols
     """
-    csv_out = csv.writer(output_file, dialect="excel-tab")
+    # Header cells are plain tab-separated values, so split and join them
+    #   directly rather than going through the csv module
     with open(input_filename) as file_in:
-        csv_in = csv.reader(file_in, dialect="excel-tab")
-        for index, line in enumerate(range(2)):
-            header = next(csv_in)
-            if extra_cols is not None:
-                if index == 0:
-                    header += extra_cols
-                if index == 1:
-                    header += ["" for i in range(len(extra_cols))]
-            csv_out.writerow(header)
+        header = file_in.readline().rstrip("\r\n").split("\t")
+        template = file_in.readline().rstrip("\r\n").split("\t")
+    if extra_cols is not None:
+        header += extra_cols
+        template += ["" for i in range(len(extra_cols))]
+    output_file.write("\t".join(header) + "\n")
+    output_file.write("\t".join(template) + "\n")
 
 
 def clean_output(df: pd.DataFrame) -> pd.DataFrame:
@@ -173,8 +170,7 @@ def clean_output(df: pd.DataFrame) -> pd.DataFrame:
     * Convert any None values to empty strings
     """
     string_columns = df.select_dtypes(include="object").columns
-    for column in string_columns:
-        df[column] = df[column].fillna("")
+    df[string_columns] = df[string_columns].fillna("")
     return df
 
 
@@ -1,21 +1,40 @@
 import argparse
-import csv
+import io
 import logging
 import os
-import shutil
-from tempfile import NamedTemporaryFile
+from concurrent.futures import ThreadPoolExecutor
 from typing import TextIO
 
 import pandas as pd
-
-from dadis_client import DadisClient
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+
+from dadis_client import DadisClient, ResponseCache
+from dadis_client.cache import DEFAULT_CACHE_TTL
+from dadis_client.schemas.responses import (
+    ApiResponse,
+    BreedResponse,
+    Species,
+    TransboundaryNamesResponse,
+)
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
+# DADIS tables are indexed on these columns for matching against VBO's
+#   dadis_name and dadis_species_name
+DADIS_MATCH_KEYS = ["dadis_breed_name", "dadis_species_name"]
+# Only these DADIS columns are needed for matching, so avoid carrying
+#   the rest through the joins
+DADIS_MATCH_COLUMNS = ["dadis_transboundary_id", "dadis_species_id"]
+
 
 def full_matching_workflow(
-    input_filename: str, output_filename: str, dadis_api_key: str
+    input_filename: str,
+    output_filename: str,
+    dadis_api_key: str,
+    use_cache: bool = True,
+    cache_ttl: float = DEFAULT_CACHE_TTL,
 ) -> pd.DataFrame:
     """
     Perform the full matching workflow:
@@ -23,150 +42,220 @@ def full_matching_workflow(
     - Read VBO data from input_filename
     - Match to DADIS to get dadis_transboundary_id
     - Save to a new TSV file at output_filename
+
+    DADIS API responses are cached on disk for cache_ttl seconds,
+    unless use_cache is False
     """
-    client = DadisClient(api_key=dadis_api_key)
-    vbo_data = read_vbo_data(input_filename)
+    cache = ResponseCache(ttl=cache_ttl) if use_cache else None
+    client = DadisClient(api_key=dadis_api_key, cache=cache)
+    vbo_data, header_lines = read_vbo_data(input_filename)
     matched_breeds = match_vbo_breeds(vbo_data=vbo_data, client=client)
 
-    # We need to create a temporary file for the output, in case we're writing
-    #   to the same filename as the input: we don't want
-    #   to overwrite/clear the input file until we can read the header from it
-    logger.info(f"Creating temporary output TSV:")
-    with NamedTemporaryFile(mode="w", delete=False) as temp_out:
+    # We write to a temporary file next to the output, in case we're
+    #   writing to the same filename as the input: the input file is only
+    #   replaced once the output has been written in full.
+    #   Renaming it into place afterwards avoids copying the data again
+    temp_filename = output_filename + ".tmp"
+    logger.info(f"Creating temporary output TSV: {temp_filename}")
+    with open(temp_filename, "w") as temp_out:
         write_tsv_header(
-            input_filename=input_filename,
+            header_lines=header_lines,
             output_file=temp_out,
             extra_cols=["dadis_transboundary_id"],
         )
         matched_breeds = clean_output(matched_breeds)
         # Write the actual data below the headers
         matched_breeds.to_csv(temp_out, sep="\t", index=False, header=False)
-        temp_out.close()
-        logger.info("Output written to temp file.")
-        shutil.copy2(src=temp_out.name, dst=output_filename)
-        logger.info(f"Copied to {output_filename}")
-        return matched_breeds
-
-
-def read_vbo_data(filename: str) -> pd.DataFrame:
-    df = pd.read_table(
-        filename,
-        skiprows=[1],
-        na_values=[],
-        keep_default_na=False,
-        dtype={"obsolete": str},
-    ).convert_dtypes(
-        infer_objects=False,
-        convert_string=False,
-        convert_boolean=False
-    )
-    return df
+    os.replace(temp_filename, output_filename)
+    logger.info(f"Output written to {output_filename}")
+    return matched_breeds
+
+
+def read_vbo_data(filename: str) -> tuple[pd.DataFrame, list[str]]:
+    """
+    Read VBO data from filename, returning the data and the two raw header
+    lines (column names and ROBOT template row)
+    """
+    # Read the column names and the ROBOT template row ourselves, then parse
+    #   the rest with pyarrow's CSV reader
+    with open(filename, "rb") as file_in:
+        # utf-8-sig drops any byte order mark, so the first column is vbo_id
+        header_lines = [file_in.readline().decode("utf-8-sig") for _ in range(2)]
+        body = file_in.read()
+    columns = header_lines[0].rstrip("\r\n").split("\t")
+    string_dtype = pd.ArrowDtype(pa.string())
+    # pyarrow refuses to parse an empty body, so build the empty frame ourselves
+    if not body.strip():
+        df = pd.DataFrame({column: pd.Series(dtype=string_dtype) for column in columns})
+        return df, header_lines
+    # Read every column as a string so values are written back exactly
+    #   as they were, e.g. "FALSE" in obsolete must not become "False".
+    #   Empty cells stay as empty strings rather than nulls
+    try:
+        table = pa_csv.read_csv(
+            pa.BufferReader(body),
+            read_options=pa_csv.ReadOptions(column_names=columns),
+            parse_options=pa_csv.ParseOptions(delimiter="\t"),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={column: pa.string() for column in columns},
+                strings_can_be_null=False,
+            ),
+        )
+    except pa.ArrowInvalid:
+        # pyarrow rejects rows with missing trailing cells, fall back to
+        #   pandas' C parser, which pads them out
+        logger.debug("pyarrow could not parse the VBO data, using the C parser")
+        df = (
+            pd.read_csv(
+                io.BytesIO(body),
+                sep="\t",
+                header=None,
+                names=columns,
+                dtype=str,
+                na_values=[],
+                keep_default_na=False,
+            )
+            .fillna("")
+            .astype(string_dtype)
+        )
+        return df, header_lines
+    df = table.to_pandas(types_mapper=pd.ArrowDtype)
+    return df, header_lines
 
 
-def get_dadis_species(client: DadisClient) -> pd.DataFrame:
-    resp = client.get_all_species()
+def get_dadis_species(resp: ApiResponse[list[Species]]) -> pd.DataFrame:
     all_species = []
     for s in resp.response:
         species = {"dadis_species_id": s.id, "dadis_species_name": s.name["en"]}
         all_species.append(species)
-    return pd.DataFrame.from_records(all_species)
+    # Species ids are small, so use 4-byte integers for them
+    return pd.DataFrame.from_records(all_species).astype({"dadis_species_id": "Int32"})
 
 
-def get_canonical_dadis_transboundary(client: DadisClient) -> pd.DataFrame:
+def get_canonical_dadis_transboundary(
+    resp: TransboundaryNamesResponse, species_df: pd.DataFrame
+) -> pd.DataFrame:
     """
-    DADIS has a canonical name for each transboundary breed, fetch these
-    and return them as a dataframe
+    DADIS has a canonical name for each transboundary breed, return these
+    as a dataframe
     """
-    resp = client.get_all_transboundary_names()
-    df = pd.DataFrame.from_records([b.model_dump() for b in resp.response]).rename(
-        columns={"speciesId": "dadis_species_id"}
+    # Build each column directly from the response models, rather than
+    #   creating a dict per breed
+    breeds = resp.response
+    df = pd.DataFrame(
+        {
+            "dadis_transboundary_id": [b.id for b in breeds],
+            "dadis_species_id": pd.array([b.speciesId for b in breeds], dtype="Int32"),
+            "dadis_breed_name": [b.name for b in breeds],
+        }
     )
-    species_df = get_dadis_species(client)
     df = df.merge(species_df, how="left", on="dadis_species_id")
-    df = df.rename(columns={"id": "dadis_transboundary_id", "name": "dadis_breed_name"})
     return df
 
 
-def get_all_dadis_transboundary(client: DadisClient) -> pd.DataFrame:
+def get_all_dadis_transboundary(
+    resp: BreedResponse, species_df: pd.DataFrame
+) -> pd.DataFrame:
     """
     Get all names for DADIS transboundary breeds, some VBO entries
     may use non-canonical names
     """
-    resp = client.get_all_transboundary_breeds()
-    df = (
-        pd.DataFrame.from_records([b.model_dump() for b in resp.response])
-        .rename(
-            columns={
-                "speciesId": "dadis_species_id",
-                "name": "dadis_breed_name",
-                "transboundaryId": "dadis_transboundary_id",
-                "id": "dadis_breed_id",
-                "iso3": "dadis_iso3_code",
-            }
+    # Only build the columns used for matching. The same breed name appears
+    #   once per country, so duplicates are dropped
+    breeds = resp.response
+    df = pd.DataFrame(
+        {
+            "dadis_breed_name": [b.name for b in breeds],
+            "dadis_species_id": pd.array([b.speciesId for b in breeds], dtype="Int32"),
+            "dadis_transboundary_id": [b.transboundaryId for b in breeds],
+        }
+    ).drop_duplicates()
+    result = df.merge(species_df, how="left", on="dadis_species_id")
+    return result
+
+
+def fetch_dadis_transboundary(
+    client: DadisClient,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Fetch the DADIS species, canonical names and all transboundary breed names
+    concurrently, returning the (canonical, all names) dataframes
+    """
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        species_future = executor.submit(client.get_all_species)
+        canonical_future = executor.submit(client.get_all_transboundary_names)
+        all_future = executor.submit(client.get_all_transboundary_breeds)
+        species_df = get_dadis_species(species_future.result())
+        dadis_canonical = get_canonical_dadis_transboundary(
+            canonical_future.result(), species_df=species_df
         )
-        .drop_duplicates(
-            subset=["dadis_species_id", "dadis_breed_name", "dadis_transboundary_id"]
+        dadis_all = get_all_dadis_transboundary(
+            all_future.result(), species_df=species_df
         )
-    )
-    species_df = get_dadis_species(client)
-    result = df.merge(species_df, how="left", on="dadis_species_id").sort_values(
-        ["dadis_transboundary_id", "dadis_breed_name"]
-    )
-    return result
+    return dadis_canonical, dadis_all
 
 
-def get_simple_matches(vbo_data: pd.DataFrame, client: DadisClient) -> pd.DataFrame:
+def get_simple_matches(
+    vbo_data: pd.DataFrame, dadis_canonical: pd.DataFrame
+) -> pd.DataFrame:
     """
     Match VBO entries to DADIS transboundary breeds based on their
-    canonical names. Return a dataframe containing the matches
+    canonical names, dropping entries that match multiple canonical breeds.
+    Return a dataframe containing the matches, indexed by vbo_id
+
+    dadis_canonical should be indexed on DADIS_MATCH_KEYS
     """
-    dadis_canonical = get_canonical_dadis_transboundary(client=client)
     # Ignore any VBO entries marked as duplicate while matching
     match_data = vbo_data.query("to_be_ignored != 'duplicate'")[
         ["vbo_id", "term_label", "dadis_name", "dadis_species_name"]
     ]
     simple_matches = (
-        match_data.merge(
-            dadis_canonical,
-            how="left",
-            left_on=["dadis_name", "dadis_species_name"],
-            right_on=["dadis_breed_name", "dadis_species_name"],
-            sort=False,
+        match_data.join(
+            dadis_canonical, on=["dadis_name", "dadis_species_name"], how="left"
         )
-        .drop(columns=["dadis_breed_name", "dadis_species_name"])
-        .convert_dtypes()
+        .drop(columns=["dadis_species_name"])
+        .drop_duplicates(subset=["vbo_id", "dadis_transboundary_id"])
+        .set_index("vbo_id")
+    )
+    multiple_ids = simple_matches.index[
+        simple_matches.index.duplicated(keep=False)
+    ].unique()
+    n_multiple = len(multiple_ids)
+    logger.info(
+        f"{n_multiple} VBO entries matched against multiple canonical DADIS names - will not be updated.  Use --log=DEBUG to see them."
     )
+    logger.debug(multiple_ids)
+    simple_matches = simple_matches.drop(index=multiple_ids)
     return simple_matches
 
 
-def get_extra_matches(vbo_data: pd.DataFrame, client: DadisClient) -> pd.DataFrame:
-    dadis_all = get_all_dadis_transboundary(client=client)
+def get_extra_matches(vbo_data: pd.DataFrame, dadis_all: pd.DataFrame) -> pd.DataFrame:
+    """
+    Match VBO entries to any DADIS transboundary breed name,
+    dropping entries that match multiple transboundary breeds.
+    Return a dataframe containing the matches, indexed by vbo_id
+
+    dadis_all should be indexed on DADIS_MATCH_KEYS
+    """
     match_data = vbo_data.query("to_be_ignored != 'duplicate'")[
         ["vbo_id", "term_label", "dadis_name", "dadis_species_name"]
     ]
     extra_matches = (
-        match_data.merge(
-            dadis_all,
-            how="left",
-            left_on=["dadis_name", "dadis_species_name"],
-            right_on=["dadis_breed_name", "dadis_species_name"],
-            indicator=True,
-            # Need to ensure we use sort=False so order stays consistent with original
-            sort=False,
-        )
-        .drop(columns=["dadis_breed_name", "dadis_species_name"])
-        .convert_dtypes()
+        # A left join keeps the order consistent with the original
+        match_data.join(dadis_all, on=["dadis_name", "dadis_species_name"], how="left")
+        .drop(columns=["dadis_species_name"])
         .drop_duplicates(subset=["vbo_id", "dadis_transboundary_id"])
+        .set_index("vbo_id")
     )
-    counts = extra_matches["vbo_id"].value_counts()
-    duplicates = counts.loc[counts >= 2].index.tolist()
-    multiple_matches = extra_matches.loc[extra_matches["vbo_id"].isin(duplicates), :]
-    n_multiple = multiple_matches["vbo_id"].nunique()
+    multiple_ids = extra_matches.index[
+        extra_matches.index.duplicated(keep=False)
+    ].unique()
+    n_multiple = len(multiple_ids)
     logger.info(
         f"{n_multiple} VBO entries matched against multiple DADIS entries - will not be updated.  Use --log=DEBUG to see them."
     )
-    logger.debug(multiple_matches["vbo_id"])
-    extra_matches = extra_matches.loc[~extra_matches["vbo_id"].isin(duplicates), :]
+    logger.debug(multiple_ids)
+    extra_matches = extra_matches.drop(index=multiple_ids)
     return extra_matches
 
 
@@ -177,53 +266,60 @@ def match_vbo_breeds(vbo_data: pd.DataFrame, client: DadisClient) -> pd.DataFram
 
     Return a modified copy of vbo_data, with the 'dadis_transboundary_id' added
     """
+    logger.info("Fetching DADIS transboundary breeds")
+    dadis_canonical, dadis_all = fetch_dadis_transboundary(client)
+    # Index the DADIS tables on their keys, so the matches can use the
+    #   indexed join path
+    match_columns = DADIS_MATCH_KEYS + DADIS_MATCH_COLUMNS
+    dadis_canonical = dadis_canonical[match_columns].set_index(DADIS_MATCH_KEYS)
+    dadis_all = dadis_all[match_columns].set_index(DADIS_MATCH_KEYS)
+
     logger.info("Matching to canonical DADIS names")
-    simple_matches = get_simple_matches(vbo_data, client)
-    logger.info("Matching to other DADIS names")
-    extra_matches = get_extra_matches(vbo_data, client)
-    all_matches = simple_matches.merge(
-        extra_matches[["vbo_id", "dadis_transboundary_id", "dadis_species_id"]],
-        how="left",
-        on="vbo_id",
-        suffixes=(None, "_extra"),
-        sort=False,
-    ).convert_dtypes()
-    # Fill in simple matches with extra matches, where no simple match was found
-    simple_ids = all_matches["dadis_transboundary_id"]
-    extra_ids = all_matches["dadis_transboundary_id_extra"]
-    all_matches["dadis_transboundary_id"] = simple_ids.where(
-        ~simple_ids.isna(), extra_ids
-    )
+    simple_matches = get_simple_matches(vbo_data, dadis_canonical)
+    simple_ids = simple_matches["dadis_transboundary_id"]
+    unmatched_ids = simple_ids.index[simple_ids.isna()]
+    n_total = simple_ids.shape[0]
+    n_matched = n_total - len(unmatched_ids)
+    if len(unmatched_ids) == 0:
+        all_ids = simple_ids
+    else:
+        # Only entries without a canonical match need to be matched against
+        #   the other names
+        logger.info("Matching to other DADIS names")
+        extra_matches = get_extra_matches(
+            vbo_data.loc[vbo_data["vbo_id"].isin(unmatched_ids)], dadis_all
+        )
+        # Build a single vbo_id -> dadis_transboundary_id lookup, filling in
+        #   simple matches with extra matches where no simple match was found
+        extra_ids = extra_matches["dadis_transboundary_id"]
+        all_ids = simple_ids.combine_first(extra_ids)
+        # Extra matches only cover entries without a simple match, so each
+        #   one adds to the simple match count
+        n_matched += extra_ids.notna().sum()
+    # DADIS transboundary ids are strings, use a nullable string column for them
+    all_ids = all_ids.astype("string")
 
-    n_total = all_matches.shape[0]
-    n_matched = all_matches["dadis_transboundary_id"].notna().sum()
     logger.info(f"{n_matched} / {n_total} VBO entries matched with DADIS")
 
-    return vbo_data.merge(
-        all_matches[["vbo_id", "dadis_transboundary_id"]],
-        on="vbo_id",
-        how="left",
-        sort=False,
-    )
+    result = vbo_data.copy()
+    result["dadis_transboundary_id"] = result["vbo_id"].map(all_ids)
+    return result
 
 
 def write_tsv_header(
-    input_filename: str, output_file: TextIO, extra_cols: list[str] = None
+    header_lines: list[str], output_file: TextIO, extra_cols: list[str] = None
 ):
     """
-    Copy the two header lines from the input file to output_file, adding the columns in extra_cols
+    Write the two header lines read by read_vbo_data to output_file, adding the columns in extra_cols
     """
-    csv_out = csv.writer(output_file, dialect="excel-tab")
-    with open(input_filename) as file_in:
-        csv_in = csv.reader(file_in, dialect="excel-tab")
-        for index, line in enumerate(range(2)):
-            header = next(csv_in)
-            if extra_cols is not None:
-                if index == 0:
-                    header += extra_cols
-                if index == 1:
-                    header += ["" for i in range(len(extra_cols))]
-            csv_out.writerow(header)
+    for index, line in enumerate(header_lines):
+        header = line.rstrip("\r\n").split("\t")
+        if extra_cols is not None:
+            if index == 0:
+                header += extra_cols
+            if index == 1:
+                header += ["" for i in range(len(extra_cols))]
+        output_file.write("\t".join(header) + "\n")
 
 
 def clean_output(df: pd.DataFrame) -> pd.DataFrame:
@@ -233,8 +329,7 @@ def clean_output(df: pd.DataFrame) -> pd.DataFrame:
     * Convert any None values to empty strings
     """
     string_columns = df.select_dtypes(include="object").columns
-    for column in string_columns:
-        df[column] = df[column].fillna("")
+    df[string_columns] = df[string_columns].fillna("")
     return df
 
 
@@ -252,6 +347,17 @@ if __name__ == "__main__":
         help="API key for DADIS API (private: should be stored in Github Secrets)",
         default=os.getenv("DADIS_API_KEY")
     )
+    parser.add_argument(
+        "--no_cache",
+        help="Always fetch from the DADIS API, ignoring any cached responses",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cache_ttl",
+        help="How long to keep cached DADIS API responses for (seconds, default one week)",
+        type=float,
+        default=DEFAULT_CACHE_TTL,
+    )
     args = parser.parse_args()
 
     if args.dadis_api_key is None:
@@ -262,4 +368,6 @@ if __name__ == "__main__":
         input_filename=args.input_filename,
         output_filename=args.output_filename,
         dadis_api_key=args.dadis_api_key,
+        use_cache=not args.no_cache,
+        cache_ttl=args.cache_ttl,
     )